@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import errno
 import logging
 import multiprocessing
 import os
@@ -10,6 +11,7 @@ import shutil
 import subprocess
 import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from os.path import join as pjoin
 from pathlib import Path
@@ -353,13 +355,35 @@ class CompileContext:
         self.asm_file: Optional[str] = None
 
     def __enter__(self) -> tuple[str, str]:
-        self.fd_code, self.code_file = tempfile.mkstemp(suffix=".c")
-        self.fd_asm, self.asm_file = tempfile.mkstemp(suffix=".s")
+        scratch_dir = utils.scratch_dir()
+        try:
+            self._create_files(scratch_dir)
+        except OSError as e:
+            if e.errno != errno.ENOSPC or scratch_dir is None:
+                raise
+            # The scratch directory filled up, use the default one instead.
+            self._remove_files()
+            self._create_files(None)
+
+        assert self.code_file and self.asm_file
+        return (self.code_file, self.asm_file)
+
+    def _create_files(self, directory: Optional[str]) -> None:
+        self.fd_code, self.code_file = tempfile.mkstemp(suffix=".c", dir=directory)
+        self.fd_asm, self.asm_file = tempfile.mkstemp(suffix=".s", dir=directory)
 
         with open(self.code_file, "w") as f:
             f.write(self.code)
 
-        return (self.code_file, self.asm_file)
+    def _remove_files(self) -> None:
+        for fd in (self.fd_code, self.fd_asm):
+            if fd is not None:
+                os.close(fd)
+        for file in (self.code_file, self.asm_file):
+            if file and Path(file).exists():
+                os.remove(file)
+        self.fd_code = self.fd_asm = None
+        self.code_file = self.asm_file = None
 
     def __exit__(
         self,
@@ -431,7 +455,12 @@ def get_asm_str(
     # Get the assembly output of `code` compiled with `compiler_setting` as str
 
     compiler_exe = get_compiler_executable(compiler_setting, bldr)
+    return _compile_to_asm(code, compiler_exe, compiler_setting)
+
 
+def _compile_to_asm(
+    code: str, compiler_exe: Path, compiler_setting: utils.CompilerSetting
+) -> str:
     with CompileContext(code) as context_res:
         code_file, asm_file = context_res
 
@@ -492,20 +521,69 @@ def find_alive_markers(
     Raises:
         CompileError: Raised when code can't be compiled.
     """
-    alive_markers = set()
+    asm = get_asm_str(code, compiler_setting, bldr)
+    return _alive_markers_in_asm(asm, marker_prefix)
 
-    # Extract alive markers
-    alive_regex = re.compile(f".*[call|jmp].*{marker_prefix}([0-9]+)_.*")
 
-    asm = get_asm_str(code, compiler_setting, bldr)
+def find_alive_markers_batch(
+    code: str,
+    compiler_settings: list[utils.CompilerSetting],
+    marker_prefix: str,
+    bldr: Builder,
+    jobs: Optional[int] = None,
+) -> list[set[str]]:
+    """Like `find_alive_markers` but for multiple settings at once.
+    Duplicate settings are only compiled once and the compilations
+    run concurrently.
+
+    Args:
+        code (str): Code with markers
+        compiler_settings (list[utils.CompilerSetting]): Compilers to use
+        marker_prefix (str): Prefix of markers (utils.get_marker_prefix)
+        bldr (Builder): Builder to get the compilers
+        jobs (Optional[int]): Maximum amount of concurrent compilations.
+            Defaults to the cores of `bldr`.
+
+    Returns:
+        list[set[str]]: Alive markers for each setting, in the order of `compiler_settings`.
+
+    Raises:
+        CompileError: Raised when code can't be compiled with any of the settings.
+    """
+    unique_settings = {str(setting): setting for setting in compiler_settings}
+
+    # Building is not thread-safe (BuildContext changes the working directory),
+    # so make sure all compilers exist before compiling in parallel.
+    executables = {
+        key: get_compiler_executable(setting, bldr)
+        for key, setting in unique_settings.items()
+    }
+
+    def alive_markers(key: str) -> set[str]:
+        asm = _compile_to_asm(code, executables[key], unique_settings[key])
+        return _alive_markers_in_asm(asm, marker_prefix)
+
+    jobs = min(jobs if jobs else bldr.cores, len(unique_settings))
+    if jobs <= 1:
+        alive = {key: alive_markers(key) for key in unique_settings}
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            alive = dict(
+                zip(unique_settings, executor.map(alive_markers, unique_settings))
+            )
 
-    for line in asm.split("\n"):
-        line = line.strip()
-        m = alive_regex.match(line)
-        if m:
-            alive_markers.add(f"{marker_prefix}{m.group(1)}_")
+    return [alive[str(setting)] for setting in compiler_settings]
+
+
+def _alive_markers_in_asm(asm: str, marker_prefix: str) -> set[str]:
+    # Extract alive markers.
+    # Scan the whole assembly at once instead of splitting it into lines first;
+    # with MULTILINE the pattern still matches each line separately.
+    alive_regex = re.compile(
+        f"^.*[call|jmp].*{marker_prefix}([0-9]+)_", flags=re.MULTILINE
+    )
 
-    return alive_markers
+    return {f"{marker_prefix}{m.group(1)}_" for m in alive_regex.finditer(asm)}
 
 
 if __name__ == "__main__":
@@ -174,7 +174,7 @@ def verify_with_ccomp(
         except subprocess.TimeoutExpired:
             res = False
 
-        logging.debug(f"CComp returncode {res}")
+        logging.debug("CComp returncode %s", res)
         return res
 
 
@@ -209,7 +209,7 @@ def use_ub_sanitizers(
                 timeout=cc_timeout,
             )
             if result.returncode != 0:
-                logging.debug(f"UB Sanitizer returncode {result.returncode}")
+                logging.debug("UB Sanitizer returncode %d", result.returncode)
                 if os.path.exists(exe.name):
                     os.remove(exe.name)
                 return False
@@ -220,7 +220,7 @@ def use_ub_sanitizers(
                 timeout=exe_timeout,
             )
             os.remove(exe.name)
-            logging.debug(f"UB Sanitizer returncode {result.returncode}")
+            logging.debug("UB Sanitizer returncode %d", result.returncode)
             return result.returncode == 0
 
 
@@ -330,7 +330,7 @@ class Checker:
         Returns:
             bool: If there is a call chain between main and the marker
         """
-        with tempfile.NamedTemporaryFile(suffix=".c") as tf:
+        with tempfile.NamedTemporaryFile(suffix=".c", dir=utils.scratch_dir()) as tf:
             with open(tf.name, "w") as f:
                 f.write(case.code)
 
@@ -369,7 +369,7 @@ class Checker:
             builder.CompileError: Getting the assembly may fail.
         """
 
-        with tempfile.NamedTemporaryFile(suffix=".c") as tf:
+        with tempfile.NamedTemporaryFile(suffix=".c", dir=utils.scratch_dir()) as tf:
             with open(tf.name, "w") as new_cfile:
                 print(case.code, file=new_cfile)
 
@@ -398,15 +398,16 @@ class Checker:
     def _emtpy_marker_code_str(self, case: utils.Case) -> str:
         marker_prefix = utils.get_marker_prefix(case.marker)
         p = re.compile(f"void {marker_prefix}(.*)\(void\);")
-        empty_body_code = ""
+        # Collect the lines and join them once instead of growing a string
+        lines = []
         for line in case.code.split("\n"):
             m = p.match(line)
             if m:
-                empty_body_code += f"\nvoid {marker_prefix}{m.group(1)}(void){{}}"
+                lines.append(f"void {marker_prefix}{m.group(1)}(void){{}}")
             else:
-                empty_body_code += f"\n{line}"
+                lines.append(line)
 
-        return empty_body_code
+        return "\n" + "\n".join(lines)
 
     def is_interesting_with_empty_marker_bodies(self, case: utils.Case) -> bool:
         """Check if `case.code` does not exhibit undefined behaviour,
@@ -422,7 +423,7 @@ class Checker:
 
         empty_body_code = self._emtpy_marker_code_str(case)
 
-        with tempfile.NamedTemporaryFile(suffix=".c") as tf:
+        with tempfile.NamedTemporaryFile(suffix=".c", dir=utils.scratch_dir()) as tf:
             with open(tf.name, "w") as f:
                 f.write(empty_body_code)
 
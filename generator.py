@@ -2,17 +2,27 @@
 
 from __future__ import annotations
 
-import json
 import logging
+import multiprocessing
 import os
 import signal
 import subprocess
-from multiprocessing import Process, Queue
+from multiprocessing.pool import Pool
 from os.path import join as pjoin
 from pathlib import Path
-from random import randint
+from queue import Empty, SimpleQueue
+from random import getrandbits
 from tempfile import NamedTemporaryFile
-from typing import TYPE_CHECKING, Generator, Optional, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Generator,
+    Iterator,
+    Optional,
+    TypeVar,
+    Union,
+)
 
 import builder
 import checker
@@ -21,8 +31,54 @@ import patchdatabase
 import utils
 
 if TYPE_CHECKING:
+    from multiprocessing.context import ForkContext, SpawnContext
+
     from patchdatabase import PatchDB
 
+T = TypeVar("T")
+
+# Seconds between checks for dead workers while waiting for results
+WORKER_CHECK_INTERVAL = 5
+# Failed tasks in a row after which the failure is assumed to be permanent
+MAX_CONSECUTIVE_FAILURES = 10
+
+
+CSMITH_BASE_CMD = (
+    "--no-unions",
+    "--safe-math",
+    "--no-argc",
+    "--no-volatiles",
+    "--no-volatile-pointers",
+)
+
+# Options which are randomly switched on or off for each csmith run.
+CSMITH_OPTIONS = (
+    "arrays",
+    "bitfields",
+    "checksum",
+    "comma-operators",
+    "compound-assignment",
+    "consts",
+    "divs",
+    "embedded-assigns",
+    "jumps",
+    "longlong",
+    "force-non-uniform-arrays",
+    "math64",
+    "muls",
+    "packed-struct",
+    "paranoid",
+    "pointers",
+    "structs",
+    "inline-function",
+    "return-structs",
+    "arg-structs",
+    "dangling-global-pointers",
+)
+
+# (disabled, enabled) flag for each option in CSMITH_OPTIONS
+CSMITH_FLAG_PAIRS = tuple((f"--no-{o}", f"--{o}") for o in CSMITH_OPTIONS)
+
 
 def run_csmith(csmith: str) -> str:
     """Generate random code with csmith.
@@ -35,43 +91,7 @@ def run_csmith(csmith: str) -> str:
     """
     tries = 0
     while True:
-        options = [
-            "arrays",
-            "bitfields",
-            "checksum",
-            "comma-operators",
-            "compound-assignment",
-            "consts",
-            "divs",
-            "embedded-assigns",
-            "jumps",
-            "longlong",
-            "force-non-uniform-arrays",
-            "math64",
-            "muls",
-            "packed-struct",
-            "paranoid",
-            "pointers",
-            "structs",
-            "inline-function",
-            "return-structs",
-            "arg-structs",
-            "dangling-global-pointers",
-        ]
-
-        cmd = [
-            csmith,
-            "--no-unions",
-            "--safe-math",
-            "--no-argc",
-            "--no-volatiles",
-            "--no-volatile-pointers",
-        ]
-        for option in options:
-            if randint(0, 1):
-                cmd.append(f"--{option}")
-            else:
-                cmd.append(f"--no-{option}")
+        cmd = _csmith_cmd(csmith)
         result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         if result.returncode == 0:
             return result.stdout.decode("utf-8")
@@ -81,6 +101,49 @@ def run_csmith(csmith: str) -> str:
                 raise Exception("CSmith failed 10 times in a row!")
 
 
+def csmith_programs(csmith: str) -> Generator[str, None, None]:
+    """Endless stream of csmith programs. While the caller works on one
+    program, csmith is already generating the next one in the background.
+
+    Args:
+        csmith (str): Path to executable or name in $PATH to csmith.
+
+    Returns:
+        Generator[str, None, None]: csmith generated programs.
+    """
+    tries = 0
+    next_proc = _start_csmith(csmith)
+    try:
+        while True:
+            proc = next_proc
+            next_proc = _start_csmith(csmith)
+            stdout, _ = proc.communicate()
+            if proc.returncode == 0:
+                tries = 0
+                yield stdout.decode("utf-8")
+            else:
+                tries += 1
+                if tries > 10:
+                    raise Exception("CSmith failed 10 times in a row!")
+    finally:
+        next_proc.kill()
+        next_proc.wait()
+
+
+def _start_csmith(csmith: str) -> subprocess.Popen[bytes]:
+    return subprocess.Popen(
+        _csmith_cmd(csmith), stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+
+
+def _csmith_cmd(csmith: str) -> list[str]:
+    # One random bit per option decides whether it is enabled.
+    bits = getrandbits(len(CSMITH_FLAG_PAIRS))
+    cmd = [csmith, *CSMITH_BASE_CMD]
+    cmd.extend(flags[(bits >> i) & 1] for i, flags in enumerate(CSMITH_FLAG_PAIRS))
+    return cmd
+
+
 def instrument_program(dcei: Path, file: Path, include_paths: list[str]) -> str:
     """Instrument a given file i.e. put markers in the file.
 
@@ -95,12 +158,16 @@ def instrument_program(dcei: Path, file: Path, include_paths: list[str]) -> str:
     cmd = [str(dcei), str(file)]
     for path in include_paths:
         cmd.append(f"--extra-arg=-isystem{str(path)}")
-    utils.run_cmd(cmd)
+    # Not using utils.run_cmd: dcei runs once per candidate and neither a copy
+    # of the environment nor its decoded output is needed.
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
     return "DCEMarker"
 
 
 def generate_file(
-    config: utils.NestedNamespace, additional_flags: str
+    config: utils.NestedNamespace,
+    additional_flags: str,
+    programs: Optional[Iterator[str]] = None,
 ) -> tuple[str, str]:
     """Generate an instrumented csmith program.
 
@@ -108,45 +175,106 @@ def generate_file(
         config (utils.NestedNamespace): THE config
         additional_flags (str): Additional flags to use when
             compiling the program when checking.
+        programs (Optional[Iterator[str]]): Where to take the csmith programs
+            from, e.g. `csmith_programs`. Runs csmith for each one if None.
 
     Returns:
         tuple[str, str]: Marker prefix and instrumented code.
     """
     additional_flags += f" -I {config.csmith.include_path}"
     while True:
-        try:
-            logging.debug("Generating new candidate...")
+        logging.debug("Generating new candidate...")
+        if programs is not None:
+            candidate = next(programs)
+        else:
             candidate = run_csmith(config.csmith.executable)
-            if len(candidate) > config.csmith.max_size:
-                continue
-            if len(candidate) < config.csmith.min_size:
+        if not config.csmith.min_size <= len(candidate) <= config.csmith.max_size:
+            continue
+        # dcei rewrites the file in place and can't read from stdin,
+        # so keep the candidate in a scratch file on tmpfs.
+        with NamedTemporaryFile(suffix=".c", dir=utils.scratch_dir()) as ntf:
+            with open(ntf.name, "w") as f:
+                print(candidate, file=f)
+            logging.debug("Checking if program is sane...")
+            # Timeouts are handled inside of sanitize.
+            if not checker.sanitize(
+                config.gcc.sane_version,
+                config.llvm.sane_version,
+                config.ccomp,
+                Path(ntf.name),
+                additional_flags,
+            ):
                 continue
-            with NamedTemporaryFile(suffix=".c") as ntf:
-                with open(ntf.name, "w") as f:
-                    print(candidate, file=f)
-                logging.debug("Checking if program is sane...")
-                if not checker.sanitize(
-                    config.gcc.sane_version,
-                    config.llvm.sane_version,
-                    config.ccomp,
-                    Path(ntf.name),
-                    additional_flags,
-                ):
-                    continue
-                include_paths = utils.find_include_paths(
-                    config.llvm.sane_version, ntf.name, additional_flags
-                )
-                include_paths.append(config.csmith.include_path)
-                logging.debug("Instrumenting candidate...")
-                marker_prefix = instrument_program(
-                    config.dcei, Path(ntf.name), include_paths
-                )
-                with open(ntf.name, "r") as f:
-                    return marker_prefix, f.read()
+            include_paths = utils.find_include_paths(
+                config.llvm.sane_version, ntf.name, additional_flags
+            )
+            include_paths.append(config.csmith.include_path)
+            logging.debug("Instrumenting candidate...")
+            marker_prefix = instrument_program(
+                config.dcei, Path(ntf.name), include_paths
+            )
+            with open(ntf.name, "r") as f:
+                return marker_prefix, f.read()
+
+
+def _get_mp_context() -> Union[ForkContext, SpawnContext]:
+    """Get the multiprocessing context for the generator workers.
+    With fork, the workers inherit the already set up builder and checker
+    instead of re-importing everything and unpickling them.
+
+    Returns:
+        Union[ForkContext, SpawnContext]: fork context if available, else spawn.
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+# Generator of the current worker process, set by `_init_worker`.
+_worker_generator: Optional[CSmithCaseGenerator] = None
+
+
+def _init_worker(case_generator: CSmithCaseGenerator) -> None:
+    """Initializer for the worker processes of `parallel_interesting_case`.
+    The generator is handed over once per worker instead of once per task.
+
+    Args:
+        case_generator (CSmithCaseGenerator): Generator to use in this worker.
+    """
+    global _worker_generator
+    _worker_generator = case_generator
+    # The workers already keep all cores busy
+    _worker_generator.compile_jobs = 1
+    logging.info("Starting worker...")
+
+
+def _generate_interesting_case(scenario: utils.Scenario) -> utils.Case:
+    """Task for the worker processes of `parallel_interesting_case`.
+
+    Args:
+        scenario (utils.Scenario): Scenario
+
+    Returns:
+        utils.Case: Interesting case.
+    """
+    assert _worker_generator is not None
+    return _worker_generator.generate_interesting_case(scenario)
+
+
+def _generate_interesting_case_archive(scenario: utils.Scenario) -> tuple[str, bytes]:
+    """Task for the worker processes of `parallel_interesting_case_file`.
+    Like `_generate_interesting_case`, but the case is already serialized
+    so the parent only has to write it to disk.
+
+    Args:
+        scenario (utils.Scenario): Scenario
 
-            return marker_prefix, candidate
-        except subprocess.TimeoutExpired:
-            pass
+    Returns:
+        tuple[str, bytes]: Digest of the code and archive of the case.
+    """
+    assert _worker_generator is not None
+    case = _worker_generator.generate_interesting_case(scenario)
+    return case.code_digest(), case.to_bytes()
 
 
 class CSmithCaseGenerator:
@@ -159,8 +287,10 @@ class CSmithCaseGenerator:
         self.config: utils.NestedNamespace = config
         self.builder: builder.Builder = builder.Builder(config, patchdb, cores)
         self.chkr: checker.Checker = checker.Checker(config, self.builder)
-        self.procs: list[Process] = []
+        self.pool: Optional[Pool] = None
         self.try_counter: int = 0
+        # Concurrent compilations per candidate, None for one per core
+        self.compile_jobs: Optional[int] = None
 
     def generate_interesting_case(self, scenario: utils.Scenario) -> utils.Case:
         """Generate a case which is interesting i.e. has one compiler which does
@@ -178,60 +308,67 @@ class CSmithCaseGenerator:
         csmith_include_flag = f"-I{self.config.csmith.include_path}"
         scenario.add_flags([csmith_include_flag])
 
-        self.try_counter = 0
-        while True:
-            self.try_counter += 1
-            logging.debug("Generating new candidate...")
-            marker_prefix, candidate_code = generate_file(self.config, "")
-
-            # Find alive markers
-            logging.debug("Getting alive markers...")
-            try:
-                target_alive_marker_list = [
-                    (
-                        tt,
-                        builder.find_alive_markers(
-                            candidate_code, tt, marker_prefix, self.builder
-                        ),
-                    )
-                    for tt in scenario.target_settings
-                ]
-
-                tester_alive_marker_list = [
-                    (
-                        tt,
-                        builder.find_alive_markers(
-                            candidate_code, tt, marker_prefix, self.builder
-                        ),
+        # Generate the next program while the current one is being checked
+        programs = csmith_programs(self.config.csmith.executable)
+        try:
+            self.try_counter = 0
+            while True:
+                self.try_counter += 1
+                logging.debug("Generating new candidate...")
+                marker_prefix, candidate_code = generate_file(self.config, "", programs)
+
+                # Find alive markers
+                logging.debug("Getting alive markers...")
+                try:
+                    alive_marker_sets = builder.find_alive_markers_batch(
+                        candidate_code,
+                        scenario.target_settings + scenario.attacker_settings,
+                        marker_prefix,
+                        self.builder,
+                        jobs=self.compile_jobs,
                     )
-                    for tt in scenario.attacker_settings
-                ]
-            except builder.CompileError:
-                continue
+                except builder.CompileError:
+                    continue
+
+                num_targets = len(scenario.target_settings)
+                target_alive_marker_list = list(
+                    zip(scenario.target_settings, alive_marker_sets[:num_targets])
+                )
+                tester_alive_marker_list = list(
+                    zip(scenario.attacker_settings, alive_marker_sets[num_targets:])
+                )
 
-            target_alive_markers = set()
-            for _, marker_set in target_alive_marker_list:
-                target_alive_markers.update(marker_set)
-
-            # Extract reduce cases
-            logging.debug("Extracting reduce cases...")
-            for marker in target_alive_markers:
-                good: list[utils.CompilerSetting] = []
-                for good_setting, good_alive_markers in tester_alive_marker_list:
-                    if (
-                        marker not in good_alive_markers
-                    ):  # i.e. the setting eliminated the call
-                        good.append(good_setting)
-
-                # Find bad cases
-                if len(good) > 0:
-                    good_opt_levels = [gs.opt_level for gs in good]
-                    for bad_setting, bad_alive_markers in target_alive_marker_list:
+                # Invert the alive marker sets, i.e. for each marker find the
+                # settings which keep it alive, so that the search below only
+                # does lookups instead of scanning all settings per marker.
+                target_alive_in: dict[str, list[utils.CompilerSetting]] = {}
+                for target_setting, marker_set in target_alive_marker_list:
+                    for marker in marker_set:
+                        target_alive_in.setdefault(marker, []).append(target_setting)
+
+                tester_alive_in: dict[str, set[int]] = {}
+                for i, (_, marker_set) in enumerate(tester_alive_marker_list):
+                    for marker in marker_set:
+                        tester_alive_in.setdefault(marker, set()).add(i)
+
+                # Extract reduce cases
+                logging.debug("Extracting reduce cases...")
+                for marker, bad_settings in target_alive_in.items():
+                    alive_in_testers = tester_alive_in.get(marker, set())
+                    if len(alive_in_testers) == len(tester_alive_marker_list):
+                        # No attacker eliminated the call
+                        continue
+                    good = [
+                        good_setting
+                        for i, (good_setting, _) in enumerate(tester_alive_marker_list)
+                        if i not in alive_in_testers
+                    ]
+
+                    # Find bad cases
+                    good_opt_levels = {gs.opt_level for gs in good}
+                    for bad_setting in bad_settings:
                         # XXX: Here you can enable inter-opt_level comparison!
-                        if (
-                            marker in bad_alive_markers
-                            and bad_setting.opt_level in good_opt_levels
-                        ):  # i.e. the setting didn't eliminate the call
+                        if bad_setting.opt_level in good_opt_levels:
                             # Create reduce case
                             case = utils.Case(
                                 code=candidate_code,
@@ -252,27 +389,16 @@ class CSmithCaseGenerator:
                                     return case
                             except builder.CompileError:
                                 continue
-            else:
-                logging.debug(
-                    f"Try {self.try_counter}: Found no case. Onto the next one!"
-                )
-
-    def _wrapper_interesting(self, queue: Queue[str], scenario: utils.Scenario) -> None:
-        """Wrapper for generate_interesting_case for easier use
-        with python multiprocessing.
-
-        Args:
-            queue (Queue): The multiprocessing queue to do IPC with.
-            scenario (utils.Scenario): Scenario
-        """
-        logging.info("Starting worker...")
-        while True:
-            case = self.generate_interesting_case(scenario)
-            queue.put(json.dumps(case.to_jsonable_dict()))
+                else:
+                    logging.debug(
+                        "Try %d: Found no case. Onto the next one!", self.try_counter
+                    )
+        finally:
+            # Don't leave the prefetched csmith process behind
+            programs.close()
 
     def parallel_interesting_case_file(
         self,
-        config: utils.NestedNamespace,
         scenario: utils.Scenario,
         processes: int,
         output_dir: os.PathLike[str],
@@ -282,7 +408,6 @@ class CSmithCaseGenerator:
         WARNING: If you use this method, you have to call `terminate_processes`
 
         Args:
-            config (utils.NestedNamespace): THE config.
             scenario (utils.Scenario): Scenario.
             processes (int): Amount of jobs.
             output_dir (os.PathLike): Directory where to output the found cases.
@@ -293,22 +418,22 @@ class CSmithCaseGenerator:
         Returns:
             Generator[Path, None, None]: Interesting case generator giving paths.
         """
-        gen = self.parallel_interesting_case(config, scenario, processes, start_stop)
+        gen = self._parallel_results(
+            _generate_interesting_case_archive, scenario, processes, start_stop
+        )
 
         counter = 0
         while True:
-            case = next(gen)
-            h = hash(str(case))
-            h = max(h, -h)
-            path = Path(pjoin(output_dir, f"case_{counter:08}-{h:019}.tar"))
-            logging.debug("Writing case to {path}...")
-            case.to_file(path)
+            h, archive = next(gen)
+            path = Path(pjoin(output_dir, f"case_{counter:08}-{h}.tar"))
+            logging.debug("Writing case to %s...", path)
+            with open(path, "wb") as f:
+                f.write(archive)
             yield path
             counter += 1
 
     def parallel_interesting_case(
         self,
-        config: utils.NestedNamespace,
         scenario: utils.Scenario,
         processes: int,
         start_stop: Optional[bool] = False,
@@ -317,7 +442,6 @@ class CSmithCaseGenerator:
         WARNING: If you use this method, you have to call `terminate_processes`
 
         Args:
-            config (utils.NestedNamespace): THE config.
             scenario (utils.Scenario): Scenario.
             processes (int): Amount of jobs.
             output_dir (os.PathLike): Directory where to output the found cases.
@@ -329,52 +453,115 @@ class CSmithCaseGenerator:
             Generator[utils.Case, None, None]: Interesting case generator giving Cases.
         """
 
-        queue: Queue[str] = Queue()
+        return self._parallel_results(
+            _generate_interesting_case, scenario, processes, start_stop
+        )
 
-        # Create processes
-        self.procs = [
-            Process(
-                target=self._wrapper_interesting,
-                args=(queue, scenario),
+    def _parallel_results(
+        self,
+        task: Callable[[utils.Scenario], T],
+        scenario: utils.Scenario,
+        processes: int,
+        start_stop: Optional[bool],
+    ) -> Generator[T, None, None]:
+        """Run `task` on a pool of workers and yield its results.
+        See `parallel_interesting_case` for the arguments.
+
+        Args:
+            task (Callable[[utils.Scenario], T]): Module level function
+                generating a result for `scenario` in a worker.
+
+        Returns:
+            Generator[T, None, None]: The results of all tasks.
+        """
+        ctx = _get_mp_context()
+        self.pool = ctx.Pool(processes, initializer=_init_worker, initargs=(self,))
+        results: SimpleQueue[Union[T, BaseException]] = SimpleQueue()
+
+        def submit() -> None:
+            assert self.pool is not None
+            self.pool.apply_async(
+                task,
+                (scenario,),
+                callback=results.put,
+                error_callback=results.put,
             )
-            for _ in range(processes)
-        ]
 
-        # Start processes
-        for p in self.procs:
-            p.daemon = True
-            p.start()
+        # Queue up more tasks than there are workers,
+        # so no worker idles while a found case is being handled.
+        for _ in range(2 * processes):
+            submit()
+
+        # The pool replaces workers which die (e.g. killed by the OOM killer),
+        # but the task they were running is lost. Watch the workers so such
+        # tasks can be resubmitted instead of silently shrinking the pipeline.
+        worker_pids = {p.pid for p in multiprocessing.active_children()}
 
-        # read queue
+        # read results
+        failures = 0
         while True:
-            # TODO: handle process failure
-            case_str: str = queue.get()
+            try:
+                res = results.get(timeout=WORKER_CHECK_INTERVAL)
+            except Empty:
+                current_pids = {p.pid for p in multiprocessing.active_children()}
+                for _ in worker_pids - current_pids:
+                    logging.warning("A worker died, resubmitting its task...")
+                    submit()
+                worker_pids = current_pids
+                continue
 
-            case = utils.Case.from_jsonable_dict(config, json.loads(case_str))
+            if isinstance(res, BaseException):
+                logging.warning("Worker failed to generate a case: %s", res)
+                failures += 1
+                if failures >= MAX_CONSECUTIVE_FAILURES:
+                    # Resubmitting would only fail again, forever
+                    self.terminate_processes()
+                    raise res
+                submit()
+                continue
 
+            failures = 0
+            submit()
             if start_stop:
-                # Send processes to "sleep"
+                # Send workers to "sleep"
                 logging.debug("Stopping workers...")
-                for p in self.procs:
-                    if p.pid is None:
-                        continue
-                    os.kill(p.pid, signal.SIGSTOP)
-            yield case
-            if start_stop:
-                logging.debug("Restarting workers...")
-                # Awake processes again for further search
-                for p in self.procs:
-                    if p.pid is None:
-                        continue
-                    os.kill(p.pid, signal.SIGCONT)
+                self._signal_workers(signal.SIGSTOP)
+            try:
+                yield res
+            finally:
+                if start_stop:
+                    logging.debug("Restarting workers...")
+                    self._signal_workers(signal.SIGCONT)
 
-    def terminate_processes(self) -> None:
-        for p in self.procs:
+    def _signal_workers(self, sig: signal.Signals) -> None:
+        """Send a signal to all worker processes of the pool.
+
+        Args:
+            sig (signal.Signals): Signal to send.
+        """
+        # The pool's workers are the only multiprocessing children we have.
+        for p in multiprocessing.active_children():
             if p.pid is None:
                 continue
-            # This is so cruel
-            os.kill(p.pid, signal.SIGCONT)
-            p.terminate()
+            try:
+                os.kill(p.pid, sig)
+            except ProcessLookupError:
+                # Exited in the meantime, the pool will replace it.
+                pass
+
+    def terminate_processes(self) -> None:
+        if self.pool is not None:
+            # Stopped workers can't act on SIGTERM
+            self._signal_workers(signal.SIGCONT)
+            self.pool.terminate()
+            self.pool = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        # The pool only makes sense in the parent and can't be pickled
+        # when spawning workers.
+        state = self.__dict__.copy()
+        state["pool"] = None
+        return state
 
 
 if __name__ == "__main__":
@@ -426,7 +613,6 @@ if __name__ == "__main__":
             amount_cases = args.amount if args.amount is not None else 0
             amount_processes = max(1, args.parallel)
             gen = case_generator.parallel_interesting_case_file(
-                config=config,
                 scenario=scenario,
                 processes=amount_processes,
                 output_dir=output_dir,
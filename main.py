@@ -56,7 +56,7 @@ def _run() -> None:
     )
 
     parallel_generator = (
-        gnrtr.parallel_interesting_case(config, scenario, args.cores, start_stop=True)
+        gnrtr.parallel_interesting_case(scenario, args.cores, start_stop=True)
         if args.parallel_generation
         else None
     )
@@ -165,9 +165,9 @@ def _run() -> None:
             )
 
         else:
-            h = abs(hash(str(case)))
-            path = output_directory / Path(f"case_{counter:08}-{h:019}.tar")
-            logging.debug("Writing case to {path}...")
+            h = case.code_digest()
+            path = output_directory / Path(f"case_{counter:08}-{h}.tar")
+            logging.debug("Writing case to %s...", path)
             case.to_file(path)
 
         counter += 1
@@ -35,6 +35,17 @@ class PatchDB:
         with open(self.path, "r") as f:
             self.data: dict[str, Any] = json.load(f)
 
+    def __getstate__(self) -> dict[str, Any]:
+        # Only hand the path to other processes (e.g. spawned generator workers)
+        # instead of pickling the whole database. Every change is saved to the
+        # file, so loading it there gives the same and most recent state.
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.path = state["path"]
+        with open(self.path, "r") as f:
+            self.data = json.load(f)
+
     @_save_db
     def save(self, patch: Path, revs: list[str], repo: Repo) -> None:
         commits = []
@@ -244,7 +244,7 @@ if __name__ == "__main__":
             scenario.attacker_settings = tmp.attacker_settings
 
         gen = gnrtr.parallel_interesting_case_file(
-            config, scenario, bldr.cores, output_dir, start_stop=True
+            scenario, bldr.cores, output_dir, start_stop=True
         )
         if args.amount == 0:
             while True:
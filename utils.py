@@ -3,6 +3,8 @@ from __future__ import annotations
 import argparse
 import copy
 import functools
+import hashlib
+import io
 import json
 import logging
 import os
@@ -126,6 +128,10 @@ class NestedNamespace(SimpleNamespace):
     def __deepcopy__(self, memo: dict[Any, Any]) -> NestedNamespace:
         return type(self)(self.__asdict())
 
+    def __reduce__(self) -> tuple[type[NestedNamespace], tuple[dict[Any, Any]]]:
+        # SimpleNamespace would recreate the object without the dictionary
+        return (type(self), (self.__asdict(),))
+
 
 def validate_config(config: Union[dict[str, Any], NestedNamespace]) -> None:
     """Given a config, check if the fields are of the correct type.
@@ -505,9 +511,11 @@ def run_cmd(
         cmd, cwd=str(working_dir), check=True, env=env, capture_output=True, **kwargs
     )
 
-    logging.debug(output.stdout.decode("utf-8").strip())
-    logging.debug(output.stderr.decode("utf-8").strip())
     res: str = output.stdout.decode("utf-8").strip()
+    # This runs for every compilation, only decode stderr when it is logged
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(res)
+        logging.debug(output.stderr.decode("utf-8").strip())
     return res
 
 
@@ -537,7 +545,30 @@ def run_cmd_to_logfile(
     )
 
 
+# Include paths found by find_include_paths per (clang, flags)
+_include_paths_cache: dict[tuple[str, str], list[str]] = {}
+
+
 def find_include_paths(clang: str, file: str, flags: str) -> list[str]:
+    """Get the system include paths clang uses when compiling `file`.
+    They only depend on the compiler and the flags, so clang is only asked
+    once per (clang, flags) pair in each process.
+
+    Args:
+        clang (str): Path to clang executable or name in $PATH.
+        file (str): File to probe with if the paths are not known yet.
+        flags (str): Additional flags to use.
+
+    Returns:
+        list[str]: Include paths in search order.
+    """
+    key = (clang, flags)
+    if key not in _include_paths_cache:
+        _include_paths_cache[key] = _probe_include_paths(clang, file, flags)
+    return list(_include_paths_cache[key])
+
+
+def _probe_include_paths(clang: str, file: str, flags: str) -> list[str]:
     cmd = [clang, file, "-c", "-o/dev/null", "-v"]
     if flags:
         cmd.extend(flags.split())
@@ -649,6 +680,47 @@ def get_compiler_settings(
     return settings
 
 
+def _get_scratch_dir() -> Optional[str]:
+    """Pick the directory for short-lived files on hot paths.
+
+    /dev/shm is a tmpfs on Linux, so files placed there never touch the disk.
+    An explicitly set TMPDIR takes precedence over it.
+
+    Returns:
+        Optional[str]: "/dev/shm" or None for tempfile's default directory.
+    """
+    if os.environ.get("TMPDIR"):
+        return None
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK | os.X_OK):
+        return "/dev/shm"
+    return None
+
+
+SCRATCH_DIR: Optional[str] = _get_scratch_dir()
+
+# Free space SCRATCH_DIR needs to have to be used. A tmpfs can be small,
+# e.g. Docker only gives 64 MiB to /dev/shm by default.
+SCRATCH_MIN_FREE = 256 * 1024 * 1024
+
+
+def scratch_dir() -> Optional[str]:
+    """Get the directory to put short-lived files of hot paths into.
+    Falls back to tempfile's default directory if SCRATCH_DIR is (nearly) full.
+
+    Returns:
+        Optional[str]: Directory to pass as `dir` to the tempfile functions.
+    """
+    if SCRATCH_DIR is None:
+        return None
+    try:
+        st = os.statvfs(SCRATCH_DIR)
+    except OSError:
+        return None
+    if st.f_bavail * st.f_frsize < SCRATCH_MIN_FREE:
+        return None
+    return SCRATCH_DIR
+
+
 def save_to_tmp_file(content: str) -> IO[bytes]:
     ntf = tempfile.NamedTemporaryFile()
     with open(ntf.name, "w") as f:
@@ -662,6 +734,16 @@ def save_to_file(path: Path, content: str) -> None:
         f.write(content)
 
 
+def add_str_to_tar(tf: tarfile.TarFile, member: str, content: str) -> None:
+    # Write straight from memory instead of going through a temporary file
+    data = content.encode("utf-8")
+    info = tarfile.TarInfo(member)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    tf.addfile(info, io.BytesIO(data))
+
+
 def check_and_get(tf: tarfile.TarFile, member: str) -> str:
     try:
         f = tf.extractfile(member)
@@ -781,35 +863,49 @@ class Case:
 
     def to_file(self, file: Path) -> None:
         with tarfile.open(file, "w") as tf:
-            ntf = save_to_tmp_file(self.code)
+            self._add_to_tar(tf)
 
-            tf.add(ntf.name, "code.c")
+    def code_digest(self) -> str:
+        """Short hash of the code, e.g. to name the file of the case.
+        Unlike `hash`, it is the same in every process.
 
-            ntf = save_to_tmp_file(self.marker)
-            tf.add(ntf.name, "marker.txt")
+        Returns:
+            str: Hex digest.
+        """
+        return hashlib.blake2b(self.code.encode("utf-8"), digest_size=8).hexdigest()
 
-            int_settings: dict[str, Any] = {}
-            int_settings["bad_setting"] = self.bad_setting.to_jsonable_dict()
-            int_settings["good_settings"] = [
-                gs.to_jsonable_dict() for gs in self.good_settings
-            ]
-            ntf = save_to_tmp_file(json.dumps(int_settings))
-            tf.add(ntf.name, "interesting_settings.json")
+    def to_bytes(self) -> bytes:
+        """Serialize the case into the same archive `to_file` writes.
+
+        Returns:
+            bytes: The archive.
+        """
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tf:
+            self._add_to_tar(tf)
+        return buf.getvalue()
+
+    def _add_to_tar(self, tf: tarfile.TarFile) -> None:
+        add_str_to_tar(tf, "code.c", self.code)
+        add_str_to_tar(tf, "marker.txt", self.marker)
+
+        int_settings: dict[str, Any] = {}
+        int_settings["bad_setting"] = self.bad_setting.to_jsonable_dict()
+        int_settings["good_settings"] = [
+            gs.to_jsonable_dict() for gs in self.good_settings
+        ]
+        add_str_to_tar(tf, "interesting_settings.json", json.dumps(int_settings))
 
-            scenario_str = json.dumps(self.scenario.to_jsonable_dict())
-            ntf = save_to_tmp_file(scenario_str)
-            tf.add(ntf.name, "scenario.json")
+        scenario_str = json.dumps(self.scenario.to_jsonable_dict())
+        add_str_to_tar(tf, "scenario.json", scenario_str)
 
-            ntf = save_to_tmp_file(str(self.timestamp))
-            tf.add(ntf.name, "timestamp.txt")
+        add_str_to_tar(tf, "timestamp.txt", str(self.timestamp))
 
-            if self.reduced_code:
-                ntf = save_to_tmp_file(self.reduced_code)
-                tf.add(ntf.name, "reduced_code_0.c")
+        if self.reduced_code:
+            add_str_to_tar(tf, "reduced_code_0.c", self.reduced_code)
 
-            if self.bisection:
-                ntf = save_to_tmp_file(self.bisection)
-                tf.add(ntf.name, "bisection_0.txt")
+        if self.bisection:
+            add_str_to_tar(tf, "bisection_0.txt", self.bisection)
 
     def to_jsonable_dict(self) -> dict[str, Any]:
         d: dict[str, Any] = {}